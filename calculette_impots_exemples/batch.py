@@ -0,0 +1,86 @@
+import collections
+
+import numpy as np
+
+from .implementation_scalaire.compute_scalar import ScalarComputationEngine
+from .implementation_vectorielle.compute_numpy import VectorComputationEngine
+from .padding import padding_strategies
+
+
+class BatchComputationEngine(object):
+    """Compute lists of sparse households {alias: value}, such as the ones produced by test_case_generator.gen.
+
+    Households setting the same aliases are grouped, and the groups are cut into batches of at most
+    max_batch_size households, each with one column per input set in the batch. A batch is computed by a vector
+    engine sized by the padding strategy, or by the scalar engine when it holds fewer than min_vector_size
+    households. Results are returned in input order, as per-household dicts or as columns.
+    """
+
+    def __init__(self, millesime, min_vector_size=16, max_batch_size=4096, padding='power_of_two'):
+        self.millesime = millesime
+        self.min_vector_size = min_vector_size
+        self.max_batch_size = max_batch_size
+        self.padding = padding_strategies[padding] if isinstance(padding, str) else padding
+
+        self.scalar_engine = ScalarComputationEngine(millesime)
+        self.alias2name = self.scalar_engine.alias2name
+        self.vector_engines = {}
+
+    def get_vector_engine(self, n):
+        # The millesime is loaded once, engines of the other sizes share its formulas
+
+        if n not in self.vector_engines:
+            if self.vector_engines:
+                self.vector_engines[n] = next(iter(self.vector_engines.values())).resize(n)
+            else:
+                self.vector_engines[n] = VectorComputationEngine(self.millesime, n)
+        return self.vector_engines[n]
+
+    def compute_many(self, cases, formula_names, columnar=False):
+        groups = collections.OrderedDict()
+        for i, case in enumerate(cases):
+            groups.setdefault(frozenset(case), []).append(i)
+
+        aliases = set().union(*groups) if groups else set()
+        names = {alias: self.alias2name.get(alias, alias) for alias in aliases}
+
+        results = {var: np.zeros(len(cases)) for var in formula_names}
+
+        # Largest groups first, so that most batches only hold a few alias sets
+
+        ordered_groups = sorted(groups.items(), key=lambda group: -len(group[1]))
+        rows = [i for _, group_rows in ordered_groups for i in group_rows]
+        row_aliases = [group_aliases for group_aliases, group_rows in ordered_groups for _ in group_rows]
+
+        for begin in range(0, len(rows), self.max_batch_size):
+            batch = rows[begin:begin + self.max_batch_size]
+            if len(batch) >= self.min_vector_size:
+                batch_aliases = set().union(*row_aliases[begin:begin + self.max_batch_size])
+                self.compute_vector(cases, batch, batch_aliases, names, formula_names, results)
+            else:
+                self.compute_scalar(cases, batch, names, formula_names, results)
+
+        if columnar:
+            return results
+
+        return [{var: float(results[var][i]) for var in formula_names} for i in range(len(cases))]
+
+    def compute_vector(self, cases, batch, aliases, names, formula_names, results):
+        n = max(self.padding(len(batch), self.max_batch_size), len(batch))
+
+        # One column per input name : an alias and its name may both be used in the same batch
+
+        input_values = {names[alias]: np.zeros(n) for alias in aliases}
+        for k, i in enumerate(batch):
+            for alias, value in cases[i].items():
+                input_values[names[alias]][k] = value
+
+        values = self.get_vector_engine(n).compute(input_values, formula_names)
+        for var in formula_names:
+            results[var][batch] = values[var][:len(batch)]
+
+    def compute_scalar(self, cases, batch, names, formula_names, results):
+        for i in batch:
+            input_values = {names[alias]: value for alias, value in cases[i].items()}
+            for var, value in self.scalar_engine.compute(input_values, formula_names).items():
+                results[var][i] = value
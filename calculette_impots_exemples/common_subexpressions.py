@@ -0,0 +1,105 @@
+commutative_functions = {'sum', 'product', 'max', 'min'}
+
+temporary_prefix = '_CSE_'
+
+
+def count_calls(computing_order, formulas):
+    def count(node):
+        if node['nodetype'] != 'call':
+            return 0
+        return 1 + sum(count(child) for child in node['args'])
+
+    return sum(count(formulas[variable]) for variable in computing_order)
+
+
+def eliminate_common_subexpressions(computing_order, formulas_light):
+    """Share structurally identical 'call' subtrees between the formulas.
+
+    Each shared subtree is computed once in a temporary formula, inserted in the computing order just before
+    its first user. Returns the new computing order, the new formulas and the number of eliminated call nodes.
+    """
+
+    # Hash-consing : every distinct subtree gets an integer id
+
+    keys = {}
+    node_ids = {}
+
+    def hash_cons(node):
+        nodetype = node['nodetype']
+
+        if nodetype == 'symbol':
+            key = ('symbol', node['name'])
+        elif nodetype == 'float':
+            key = ('float', node['value'])
+        elif nodetype == 'call':
+            args = tuple(hash_cons(child) for child in node['args'])
+            if node['name'] in commutative_functions:
+                args = tuple(sorted(args))
+            key = ('call', node['name'], args)
+        else:
+            raise ValueError('Unknown type : %s'%nodetype)
+
+        if key not in keys:
+            keys[key] = len(keys)
+        node_ids[id(node)] = keys[key]
+        return keys[key]
+
+    for variable in computing_order:
+        hash_cons(formulas_light[variable])
+
+    # A subtree is only visited again if it is not inside an already visited copy
+
+    visits = {}
+
+    def count_visits(node):
+        if node['nodetype'] != 'call':
+            return
+        node_id = node_ids[id(node)]
+        visits[node_id] = visits.get(node_id, 0) + 1
+        if visits[node_id] == 1:
+            for child in node['args']:
+                count_visits(child)
+
+    for variable in computing_order:
+        count_visits(formulas_light[variable])
+
+    shared = {node_id for node_id, n_visits in visits.items() if n_visits > 1}
+
+    # Rewrite the formulas, hoisting shared subtrees into temporary formulas
+
+    temporaries = {}
+    new_formulas = dict(formulas_light)
+    new_computing_order = []
+
+    def rewrite(node, pending):
+        if node['nodetype'] != 'call':
+            return node
+
+        node_id = node_ids[id(node)]
+        if node_id in shared and node_id in temporaries:
+            return {'nodetype': 'symbol', 'name': temporaries[node_id]}
+
+        new_node = {
+            'nodetype': 'call',
+            'name': node['name'],
+            'args': [rewrite(child, pending) for child in node['args']],
+        }
+
+        if node_id not in shared:
+            return new_node
+
+        name = '%s%d'%(temporary_prefix, len(temporaries))
+        temporaries[node_id] = name
+        new_formulas[name] = new_node
+        pending.append(name)
+        return {'nodetype': 'symbol', 'name': name}
+
+    for variable in computing_order:
+        pending = []
+        new_formulas[variable] = rewrite(formulas_light[variable], pending)
+        new_computing_order.extend(pending)
+        new_computing_order.append(variable)
+
+    n_eliminated = count_calls(computing_order, formulas_light) - count_calls(new_computing_order, new_formulas)
+
+    return new_computing_order, new_formulas, n_eliminated
@@ -0,0 +1,222 @@
+import argparse
+import collections
+import time
+
+import numpy as np
+
+from .implementation_scalaire.compute_scalar import ScalarComputationEngine
+from .implementation_vectorielle.compute_numpy import VectorComputationEngine
+from .implementation_gpu.compute_gpu import GPUComputationEngine
+from .test_case_generator import gen_columns
+
+
+# Every mode evaluates {alias: array of n values} into {formula: array of n values}
+
+class ScalarMode(object):
+    def __init__(self, millesime, n, cse):
+        self.engine = ScalarComputationEngine(millesime, cse=cse)
+        self.n = n
+
+    def compute(self, alias_values, formula_names):
+        results = {var: np.zeros(self.n) for var in formula_names}
+        for i in range(self.n):
+            case = {alias: values[i] for alias, values in alias_values.items() if values[i] != 0}
+            for var, value in self.engine.compute(case, formula_names).items():
+                results[var][i] = value
+        return results
+
+
+class VectorMode(object):
+    def __init__(self, millesime, n, cse):
+        self.engine = VectorComputationEngine(millesime, n, cse=cse)
+
+    def compute(self, alias_values, formula_names):
+        return self.engine.compute(alias_values, formula_names)
+
+
+class GPUMode(object):
+    def __init__(self, millesime, n, cse):
+        self.engine = GPUComputationEngine(millesime, n, cse=cse)
+
+    def compute(self, alias_values, formula_names):
+        return self.engine.compute(alias_values, list(formula_names))
+
+
+modes = collections.OrderedDict([
+    ('vector', (VectorMode, False)),
+    ('vector_cse', (VectorMode, True)),
+    ('scalar', (ScalarMode, False)),
+    ('scalar_cse', (ScalarMode, True)),
+    ('gpu', (GPUMode, False)),
+    ('gpu_cse', (GPUMode, True)),
+])
+
+reference_mode = 'vector'
+
+# Modes evaluating one household at a time only run on the first n_slow rows of the population
+
+slow_modes = {'scalar', 'scalar_cse'}
+
+
+Mismatch = collections.namedtuple('Mismatch', [
+    'millesime', 'mode', 'row', 'case', 'minimal_case', 'first_node', 'reference_value', 'value',
+])
+
+
+class ConformanceHarness(object):
+    """Compare every engine and optimization mode to the reference mode on a seeded population.
+
+    The population is evaluated by chunks of chunk_size households, and all outputs are compared in bulk with
+    np.isclose. Each mismatching household (at most max_shrink per mode and millesime) is then shrunk to a
+    minimal household, and the first formula of the computing order on which the mode diverges is reported.
+    """
+
+    def __init__(self, millesimes, modes=tuple(modes), outputs=None, chunk_size=20000, n_slow=1000, rtol=1e-9, atol=1e-6, max_shrink=10):
+        self.millesimes = millesimes
+        self.modes = [mode for mode in modes if mode != reference_mode]
+        self.outputs = outputs
+        self.chunk_size = chunk_size
+        self.n_slow = n_slow
+        self.rtol = rtol
+        self.atol = atol
+        self.max_shrink = max_shrink
+
+        self.engines = {}
+
+    def get_mode(self, mode, millesime, n):
+        if (mode, millesime, n) not in self.engines:
+            mode_class, cse = modes[mode]
+            self.engines[mode, millesime, n] = mode_class(millesime, n, cse)
+        return self.engines[mode, millesime, n]
+
+    def differs(self, reference_values, values):
+        return ~np.isclose(values, reference_values, rtol=self.rtol, atol=self.atol, equal_nan=True)
+
+    def run(self, n, seed=0):
+        population = gen_columns(n, seed)
+        report = {}
+
+        for millesime in self.millesimes:
+            reference = self.get_mode(reference_mode, millesime, self.chunk_size)
+            outputs = self.outputs or reference.engine.computing_order
+
+            mismatching_rows = {}
+            errors = {}
+
+            for begin in range(0, n, self.chunk_size):
+                end = min(begin + self.chunk_size, n)
+                chunk = {}
+                for alias, values in population.items():
+                    chunk[alias] = np.zeros(self.chunk_size)
+                    chunk[alias][:end - begin] = values[begin:end]
+
+                reference_values = reference.compute(chunk, outputs)
+
+                for mode in self.modes:
+                    if mode in errors:
+                        continue
+
+                    n_rows = end - begin
+                    if mode in slow_modes:
+                        n_rows = min(n_rows, self.n_slow - begin)
+                    if n_rows <= 0:
+                        continue
+
+                    try:
+                        engine = self.get_mode(mode, millesime, self.chunk_size if mode not in slow_modes else n_rows)
+                        values = engine.compute({alias: column[:n_rows] if mode in slow_modes else column for alias, column in chunk.items()}, outputs)
+                    except Exception as error:
+                        errors[mode] = repr(error)
+                        continue
+
+                    mismatch = np.zeros(n_rows, dtype=bool)
+                    for var in outputs:
+                        mismatch |= self.differs(reference_values[var][:n_rows], values[var][:n_rows])
+
+                    rows = mismatching_rows.setdefault(mode, [])
+                    rows.extend(begin + np.flatnonzero(mismatch))
+
+            report[millesime] = {
+                'n_cases': n,
+                'errors': errors,
+                'n_mismatches': {mode: len(mismatching_rows.get(mode, [])) for mode in self.modes if mode not in errors},
+                'mismatches': [
+                    self.shrink(millesime, mode, row, population, outputs)
+                    for mode, rows in mismatching_rows.items()
+                    for row in rows[:self.max_shrink]
+                ],
+            }
+
+        return report
+
+    def compare_case(self, millesime, mode, case, formula_names):
+        # Returns the first formula on which mode diverges for this household, with both values, or None
+
+        alias_values = {alias: np.array([value]) for alias, value in case.items()}
+        reference_values = self.get_mode(reference_mode, millesime, 1).compute(alias_values, formula_names)
+        values = self.get_mode(mode, millesime, 1).compute(alias_values, formula_names)
+
+        for var in formula_names:
+            if self.differs(reference_values[var], values[var])[0]:
+                return var, float(reference_values[var][0]), float(values[var][0])
+        return None
+
+    def shrink(self, millesime, mode, row, population, outputs):
+        computing_order = self.get_mode(reference_mode, millesime, 1).engine.computing_order
+        case = {alias: float(values[row]) for alias, values in population.items() if values[row] != 0}
+
+        def diverges(candidate):
+            return self.compare_case(millesime, mode, candidate, outputs) is not None
+
+        # Remove aliases, then simplify the remaining values, as long as one of the outputs still differs. The whole
+        # computing order is only compared on the minimal household, to find the first diverging formula
+
+        minimal_case = dict(case)
+        for alias in sorted(case):
+            candidate = {k: v for k, v in minimal_case.items() if k != alias}
+            if diverges(candidate):
+                minimal_case = candidate
+
+        for alias in sorted(minimal_case):
+            for simpler in (1., 10. ** np.floor(np.log10(abs(minimal_case[alias]))), np.round(minimal_case[alias], -2)):
+                candidate = dict(minimal_case)
+                candidate[alias] = float(simpler)
+                if abs(simpler) < abs(minimal_case[alias]) and diverges(candidate):
+                    minimal_case = candidate
+
+        first_node, reference_value, value = self.compare_case(millesime, mode, minimal_case, computing_order) or (None, None, None)
+
+        return Mismatch(millesime, mode, int(row), case, minimal_case, first_node, reference_value, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparaison des moteurs d'exécution sur une population aléatoire")
+    parser.add_argument('millesimes', nargs='+')
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', choices=list(modes), default=list(modes))
+    parser.add_argument('--outputs', nargs='+', default=None)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--n-slow', type=int, default=1000)
+    parser.add_argument('--max-shrink', type=int, default=10)
+    args = parser.parse_args()
+
+    harness = ConformanceHarness(args.millesimes, args.modes, args.outputs, args.chunk_size, args.n_slow, max_shrink=args.max_shrink)
+
+    start = time.time()
+    report = harness.run(args.n, args.seed)
+
+    for millesime, result in report.items():
+        print('%s : %d foyers' % (millesime, result['n_cases']))
+        for mode, error in result['errors'].items():
+            print('  %s : erreur %s' % (mode, error))
+        for mode, n_mismatches in result['n_mismatches'].items():
+            print('  %s : %d écarts' % (mode, n_mismatches))
+        for mismatch in result['mismatches']:
+            print('  %s, foyer %d : %s diverge (%r au lieu de %r) pour %r' % (
+                mismatch.mode, mismatch.row, mismatch.first_node, mismatch.value, mismatch.reference_value, mismatch.minimal_case))
+    print('%.1f s' % (time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from .loader import load_json
+
+
+FORMULA, INPUT, CONSTANT, UNKNOWN = range(4)
+
+# Estimated cost of a call, per operand beyond the first for the n-ary functions
+
+op_costs = {
+    'sum': 1.,
+    'product': 1.,
+    'max': 1.,
+    'min': 1.,
+    'boolean:ou': 1.,
+    'boolean:et': 1.,
+    'dans': 1.,
+    'negate': 1.,
+    'unary:-': 1.,
+    'positif': 1.,
+    'positif_ou_nul': 1.,
+    'null': 1.,
+    'present': 1.,
+    'operator:>=': 1.,
+    'operator:<=': 1.,
+    'operator:>': 1.,
+    'operator:<': 1.,
+    'operator:=': 1.,
+    'abs': 1.,
+    'inf': 2.,
+    'arr': 2.,
+    'si': 2.,
+    'ternary': 3.,
+    'invert': 3.,
+}
+
+
+def gather(indptr, indices, nodes):
+    # Concatenation of the CSR rows of nodes
+
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(lengths.sum())]
+
+
+class FormulaGraph(object):
+    """Dependency graph of the formulas, indexed by integers and stored as CSR adjacency arrays.
+
+    Formulas are numbered first, in computing order, followed by the inputs, constants and unknowns they use.
+    dependencies[indptr[i]:indptr[i+1]] are the direct dependencies of node i, dependents[reverse_indptr[i]:
+    reverse_indptr[i+1]] the nodes that directly depend on it.
+    """
+
+    def __init__(self, computing_order, formulas_light, inputs_light, constants_light, unknowns_light):
+        self.names = list(dict.fromkeys(computing_order))
+        self.n_formulas = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        inputs_light = set(inputs_light)
+        constants_light = set(constants_light)
+        unknowns_light = set(unknowns_light)
+        categories = [FORMULA] * self.n_formulas
+        costs = []
+        edges = []
+
+        def visit(node, children):
+            nodetype = node['nodetype']
+
+            if nodetype == 'symbol':
+                name = node['name']
+                if name not in self.index:
+                    self.index[name] = len(self.names)
+                    self.names.append(name)
+                    if name in inputs_light:
+                        categories.append(INPUT)
+                    elif name in constants_light:
+                        categories.append(CONSTANT)
+                    elif name in unknowns_light:
+                        categories.append(UNKNOWN)
+                    else:
+                        raise Exception('Unknown variable category.')
+                children.add(self.index[name])
+                return 0.
+
+            if nodetype == 'float':
+                return 0.
+
+            if nodetype == 'call':
+                cost = op_costs.get(node['name'], 1.) * max(len(node['args']) - 1, 1)
+                return cost + sum(visit(child, children) for child in node['args'])
+
+            raise ValueError('Unknown type : %s'%nodetype)
+
+        for name in self.names[:self.n_formulas]:
+            children = set()
+            costs.append(visit(formulas_light[name], children))
+            edges.append(sorted(children))
+
+        self.n_nodes = len(self.names)
+        self.categories = np.array(categories, dtype=np.int8)
+        self.costs = np.zeros(self.n_nodes)
+        self.costs[:self.n_formulas] = costs
+
+        lengths = np.zeros(self.n_nodes, dtype=np.int64)
+        lengths[:self.n_formulas] = [len(children) for children in edges]
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.dependencies = np.array([child for children in edges for child in children], dtype=np.int64)
+
+        sources = np.repeat(np.arange(self.n_nodes), lengths)
+        order = np.argsort(self.dependencies, kind='stable')
+        self.reverse_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.dependencies, minlength=self.n_nodes))])
+        self.dependents = sources[order]
+
+        # Topological level (longest path in number of formulas from a leaf) and cost-weighted finish time
+
+        self.levels = np.zeros(self.n_nodes, dtype=np.int64)
+        self.finish_times = self.costs.copy()
+        for i in range(self.n_formulas):
+            children = self.dependencies[self.indptr[i]:self.indptr[i + 1]]
+            if len(children):
+                self.levels[i] = self.levels[children].max() + 1
+                self.finish_times[i] += self.finish_times[children].max()
+
+    @classmethod
+    def from_millesime(cls, millesime):
+        computing_order, children_light, formulas_light, constants_light, inputs_light, unknowns_light, input_variables = load_json(millesime)
+        return cls(computing_order, formulas_light, inputs_light, constants_light, unknowns_light)
+
+    def indices(self, names):
+        return np.array([self.index[name] for name in names], dtype=np.int64)
+
+    def cone(self, outputs):
+        """Sorted indices of the outputs and of every node they transitively depend on."""
+
+        mask = np.zeros(self.n_nodes, dtype=bool)
+        frontier = np.unique(self.indices(outputs))
+        while len(frontier):
+            mask[frontier] = True
+            frontier = np.unique(gather(self.indptr, self.dependencies, frontier))
+            frontier = frontier[~mask[frontier]]
+        return np.flatnonzero(mask)
+
+    def formula_cone(self, outputs):
+        """Names of the formulas needed by the outputs, in computing order."""
+
+        cone = self.cone(outputs)
+        return [self.names[i] for i in cone[cone < self.n_formulas]]
+
+    def critical_path_length(self, outputs, weighted=False):
+        values = self.finish_times if weighted else self.levels
+        return values[self.indices(outputs)].max()
+
+    def level_widths(self, outputs=None):
+        # Number of formulas at each topological level, formulas at the same level can be computed together
+
+        formulas = np.arange(self.n_formulas) if outputs is None else self.cone(outputs)
+        formulas = formulas[formulas < self.n_formulas]
+        return np.bincount(self.levels[formulas])
+
+    def cone_cost(self, outputs):
+        return self.costs[self.cone(outputs)].sum()
+
+    def iter_graphml(self, outputs=None):
+        # Outputs are drawn in red and inputs in green, edges go from a formula to its dependencies
+
+        nodes = np.arange(self.n_nodes) if outputs is None else self.cone(outputs)
+        highlighted = set() if outputs is None else set(self.indices(outputs))
+
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        yield '  <key attr.name="Node Label" attr.type="string" for="node" id="label"/>\n'
+        yield '  <key attr.name="Color" attr.type="string" for="node" id="color"/>\n'
+        yield '  <key attr.name="Level" attr.type="int" for="node" id="level"/>\n'
+        yield '  <key attr.name="Cost" attr.type="double" for="node" id="cost"/>\n'
+        yield '  <graph id="principal" edgedefault="directed">\n'
+
+        for i in nodes:
+            yield '    <node id=%s><data key="label">%s</data>' % (quoteattr(self.names[i]), escape(self.names[i]))
+            if i in highlighted:
+                yield '<data key="color">#FF0000</data>'
+            elif self.categories[i] == INPUT:
+                yield '<data key="color">#00FF00</data>'
+            yield '<data key="level">%d</data><data key="cost">%r</data></node>\n' % (self.levels[i], float(self.costs[i]))
+
+        for i in nodes[nodes < self.n_formulas]:
+            source = quoteattr(self.names[i])
+            for j in self.dependencies[self.indptr[i]:self.indptr[i + 1]]:
+                yield '    <edge source=%s target=%s/>\n' % (source, quoteattr(self.names[j]))
+
+        yield '  </graph>\n'
+        yield '</graphml>\n'
+
+    def write_graphml(self, f, outputs=None):
+        for chunk in self.iter_graphml(outputs):
+            f.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export GraphML du graphe des formules')
+    parser.add_argument('millesime')
+    parser.add_argument('outputs', nargs='*', help='variables de sortie (toutes les formules par défaut)')
+    parser.add_argument('-o', '--output-file', default=None)
+    args = parser.parse_args()
+
+    graph = FormulaGraph.from_millesime(args.millesime)
+    outputs = args.outputs or None
+
+    if args.output_file is None:
+        graph.write_graphml(sys.stdout, outputs)
+    else:
+        with open(args.output_file, 'w') as f:
+            graph.write_graphml(f, outputs)
+
+
+if __name__ == '__main__':
+    main()
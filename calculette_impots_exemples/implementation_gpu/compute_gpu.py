@@ -5,10 +5,11 @@ import tensorflow as tf
 
 from .function_set_gpu import get_functions_mapping
 from ..loader import load_json
+from ..common_subexpressions import eliminate_common_subexpressions
 
 
 class GPUComputationEngine(object):
-    def __init__(self, millesime, n_batch):
+    def __init__(self, millesime, n_batch, cse=True):
         self.millesime = millesime
         self.n_batch = n_batch
 
@@ -16,6 +17,10 @@ class GPUComputationEngine(object):
 
         self.alias2name = {i['alias']: i['name'] for i in self.input_variables}
 
+        self.n_eliminated_nodes = 0
+        if cse:
+            self.computing_order, self.formulas_light, self.n_eliminated_nodes = eliminate_common_subexpressions(self.computing_order, self.formulas_light)
+
         self.functions_mapping, self.tf_constant_zero, self.tf_constant_one, self.tf_constant_false, self.tf_constant_true = get_functions_mapping(n_batch)
 
         # Index and reverse index for formulas, constants and input variables
@@ -72,6 +77,8 @@ class GPUComputationEngine(object):
 
             raise ValueError('Unknown type : %s'%nodetype)
 
+        self.session = None
+
         self.tf_formulas = {}
         for var in self.computing_order:
             self.tf_formulas[var] = build_graph(self.formulas_light[var])
@@ -95,8 +102,12 @@ class GPUComputationEngine(object):
 
         input_values = prepare(alias_values)
 
-        # Make the computation
-        with tf.Session() as sess:
-            result = sess.run(self.tf_formulas[formula_name], feed_dict={self.tf_inputs: input_values})
+        # Make the computation, a list of formula names is computed by a single run of the session
+        if self.session is None:
+            self.session = tf.Session()
+
+        if isinstance(formula_name, str):
+            return self.session.run(self.tf_formulas[formula_name], feed_dict={self.tf_inputs: input_values})
 
-        return result
+        results = self.session.run([self.tf_formulas[name] for name in formula_name], feed_dict={self.tf_inputs: input_values})
+        return dict(zip(formula_name, results))
@@ -2,16 +2,21 @@ import json
 
 from .function_set_scalaire import functions_mapping
 from ..loader import load_json
+from ..common_subexpressions import eliminate_common_subexpressions
 
 
 class ScalarComputationEngine(object):
-    def __init__(self, millesime):
+    def __init__(self, millesime, cse=True):
         self.millesime = millesime
 
         self.computing_order, self.children_light, self.formulas_light, self.constants_light, self.inputs_light, self.unknowns_light, self.input_variables = load_json(millesime)
 
         self.alias2name = {i['alias']: i['name'] for i in self.input_variables}
 
+        self.n_eliminated_nodes = 0
+        if cse:
+            self.computing_order, self.formulas_light, self.n_eliminated_nodes = eliminate_common_subexpressions(self.computing_order, self.formulas_light)
+
 
     def compute(self, alias_values, formula_names):
 
@@ -14,7 +14,7 @@ def boolean_or(operands):
 
 def boolean_et(operands):
     for e in operands:
-        if not operands:
+        if not e:
             return 0.
     return 1.
 
@@ -1,13 +1,15 @@
+import copy
 import json
 
 import numpy as np
 
 from .function_set_numpy import get_functions_mapping
 from ..loader import load_json
+from ..common_subexpressions import eliminate_common_subexpressions
 
 
 class VectorComputationEngine(object):
-    def __init__(self, millesime, n):
+    def __init__(self, millesime, n, cse=True):
         self.millesime = millesime
         self.n = n
 
@@ -15,8 +17,19 @@ class VectorComputationEngine(object):
 
         self.alias2name = {i['alias']: i['name'] for i in self.input_variables}
 
+        self.n_eliminated_nodes = 0
+        if cse:
+            self.computing_order, self.formulas_light, self.n_eliminated_nodes = eliminate_common_subexpressions(self.computing_order, self.formulas_light)
+
         self.functions_mapping = get_functions_mapping(n)
 
+    def resize(self, n):
+        # Engine of size n sharing the formulas already loaded by this one
+        engine = copy.copy(self)
+        engine.n = n
+        engine.functions_mapping = get_functions_mapping(n)
+        return engine
+
     def compute(self, alias_values, formula_names):
 
         def get_value(name, input_values, computed_values):
@@ -8,6 +8,9 @@ import calculette_impots_m_language_parser
 package_base_dir = os.path.dirname(os.path.dirname(inspect.getfile(calculette_impots_m_language_parser)))
 json_dir = os.path.join(package_base_dir, 'json')
 
+def list_millesimes():
+    return sorted(name for name in os.listdir(json_dir) if os.path.isdir(os.path.join(json_dir, name)))
+
 def load_json(millesime):
     simplified_ast_dir = os.path.join(json_dir, millesime, '2_simplified_ast')
     light_ast_dir = os.path.join(json_dir, millesime, '3_light_ast')
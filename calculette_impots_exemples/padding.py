@@ -0,0 +1,15 @@
+def fixed_padding(batch_size, max_batch_size):
+    return max_batch_size
+
+
+def power_of_two_padding(batch_size, max_batch_size):
+    n = 1
+    while n < batch_size:
+        n *= 2
+    return min(n, max_batch_size)
+
+
+padding_strategies = {
+    'fixed': fixed_padding,
+    'power_of_two': power_of_two_padding,
+}
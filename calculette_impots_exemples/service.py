@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import collections
+import json
+import numbers
+import time
+
+import numpy as np
+
+from .implementation_vectorielle.compute_numpy import VectorComputationEngine
+from .loader import list_millesimes
+from .padding import padding_strategies
+
+
+class RequestError(ValueError):
+    pass
+
+
+class ServiceClosed(RuntimeError):
+    pass
+
+
+class MicroBatchingService(object):
+    """Gather single-household requests into micro-batches evaluated by the vector engine.
+
+    A batch is closed when it holds max_batch_size requests or when its first request has waited max_wait
+    seconds. Each batch is padded with empty households up to the engine size given by the padding strategy
+    ('fixed', 'power_of_two' or a function (batch_size, max_batch_size) -> n). At most max_queue_size requests
+    wait per millesime : further calls to compute wait for room in the queue. Throughput is measured over the last
+    throughput_window seconds.
+    """
+
+    def __init__(self, max_batch_size=256, max_wait=0.01, padding='power_of_two', max_queue_size=4096, n_latencies=10000, throughput_window=10.):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.padding = padding_strategies[padding] if isinstance(padding, str) else padding
+        self.max_queue_size = max_queue_size
+
+        self.engines = {}
+        self.formulas_light = {}
+        self.ready = {}
+        self.queues = {}
+        self.workers = {}
+        self.in_flight = {}
+        self.closed = False
+
+        self.latencies = collections.deque(maxlen=n_latencies)
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_failed_requests = 0
+        self.n_padded_rows = 0
+        self.throughput_window = throughput_window
+        self.completions = collections.deque()
+        self.start_time = time.monotonic()
+
+    def engine_size(self, batch_size):
+        return max(self.padding(batch_size, self.max_batch_size), batch_size)
+
+    def padded_sizes(self):
+        return sorted({self.engine_size(batch_size) for batch_size in range(1, self.max_batch_size + 1)})
+
+    def load_engines(self, millesime):
+        engine = VectorComputationEngine(millesime, self.max_batch_size)
+        self.formulas_light[millesime] = engine.formulas_light
+        for n in self.padded_sizes():
+            self.engines[millesime, n] = engine if n == engine.n else engine.resize(n)
+
+    async def warm(self, millesime):
+        # Build the engines of every padded size before the first request of the millesime is queued
+
+        if not isinstance(millesime, str):
+            raise RequestError('Unknown millesime : %r'%(millesime,))
+        if millesime not in self.ready:
+            if millesime not in list_millesimes():
+                raise RequestError('Unknown millesime : %s'%millesime)
+            loop = asyncio.get_event_loop()
+            self.ready[millesime] = loop.run_in_executor(None, self.load_engines, millesime)
+
+        # A failed load is forgotten, so that the next request tries again
+
+        ready = self.ready[millesime]
+        try:
+            await ready
+        except Exception:
+            if self.ready.get(millesime) is ready:
+                del self.ready[millesime]
+            raise
+
+        if self.closed:
+            raise ServiceClosed('Service closed.')
+
+        if millesime not in self.queues:
+            self.queues[millesime] = asyncio.Queue(maxsize=self.max_queue_size)
+            self.workers[millesime] = asyncio.ensure_future(self.batch_loop(millesime))
+
+    async def compute(self, millesime, alias_values, formula_names):
+        if self.closed:
+            raise ServiceClosed('Service closed.')
+        await self.warm(millesime)
+
+        # Invalid requests are rejected here, so that they do not fail the other requests of their batch
+
+        for var in formula_names:
+            if var not in self.formulas_light[millesime]:
+                raise RequestError('Unknown formula : %s'%var)
+        for alias, value in alias_values.items():
+            if not isinstance(value, numbers.Real):
+                raise RequestError('Non-numeric value for %s : %r'%(alias, value))
+
+        future = asyncio.get_event_loop().create_future()
+        await self.queues[millesime].put((alias_values, formula_names, future, time.monotonic()))
+        if self.closed:
+            future.cancel()
+        return await future
+
+    async def batch_loop(self, millesime):
+        loop = asyncio.get_event_loop()
+        queue = self.queues[millesime]
+
+        while True:
+            batch = [await queue.get()]
+            self.in_flight[millesime] = batch
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(None, self.compute_batch, millesime, batch)
+            except Exception as error:
+                results = [error] * len(batch)
+            finally:
+                self.in_flight.pop(millesime, None)
+
+            now = time.monotonic()
+            self.n_requests += len(batch)
+            self.n_batches += 1
+            self.n_padded_rows += self.engine_size(len(batch)) - len(batch)
+            self.completions.append((now, len(batch)))
+            self.prune_completions(now)
+
+            for (_, _, future, arrival), result in zip(batch, results):
+                self.latencies.append(now - arrival)
+                if isinstance(result, Exception):
+                    self.n_failed_requests += 1
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def compute_batch(self, millesime, batch):
+        # Returns the result of each request, or the exception raised while building it
+
+        n = self.engine_size(len(batch))
+        engine = self.engines[millesime, n]
+
+        # One column per input name : an alias and its name may both be used in the same batch
+
+        input_values = {}
+        formula_names = set()
+        errors = {}
+        for i, (case, names, _, _) in enumerate(batch):
+            try:
+                for alias, value in case.items():
+                    name = engine.alias2name.get(alias, alias)
+                    if name not in input_values:
+                        input_values[name] = np.zeros(n)
+                    input_values[name][i] = value
+            except Exception as error:
+                errors[i] = error
+                for column in input_values.values():
+                    column[i] = 0.
+                continue
+            formula_names.update(var for var in names if var in engine.formulas_light)
+
+        values = engine.compute(input_values, sorted(formula_names))
+
+        results = []
+        for i, (_, names, _, _) in enumerate(batch):
+            if i in errors:
+                results.append(errors[i])
+                continue
+            try:
+                results.append({var: float(values[var][i]) for var in names})
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def prune_completions(self, now):
+        while self.completions and self.completions[0][0] < now - self.throughput_window:
+            self.completions.popleft()
+
+    def metrics(self):
+        now = time.monotonic()
+        self.prune_completions(now)
+        window = min(self.throughput_window, now - self.start_time)
+        latencies = np.array(self.latencies)
+
+        metrics = {
+            'n_requests': self.n_requests,
+            'n_failed_requests': self.n_failed_requests,
+            'n_batches': self.n_batches,
+            'mean_batch_size': self.n_requests / self.n_batches if self.n_batches else 0.,
+            'n_padded_rows': self.n_padded_rows,
+            'throughput': sum(count for _, count in self.completions) / window if window > 0 else 0.,
+            'queue_sizes': {millesime: queue.qsize() for millesime, queue in self.queues.items()},
+        }
+        if len(latencies):
+            for percentile in (50, 95, 99):
+                metrics['latency_p%d'%percentile] = float(np.percentile(latencies, percentile))
+            metrics['latency_max'] = float(latencies.max())
+
+        return metrics
+
+    def close(self):
+        # Queued and in-flight requests are cancelled, their callers get a CancelledError
+
+        self.closed = True
+        for worker in self.workers.values():
+            worker.cancel()
+        for batch in self.in_flight.values():
+            for _, _, future, _ in batch:
+                future.cancel()
+        for queue in self.queues.values():
+            while not queue.empty():
+                _, _, future, _ = queue.get_nowait()
+                future.cancel()
+        self.in_flight = {}
+        self.workers = {}
+
+
+async def read_http_request(reader):
+    # Returns the method, the path and the body, raises RequestError on a malformed request
+
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        method, path = request_line[:2]
+    except (ValueError, UnicodeDecodeError, asyncio.IncompleteReadError) as error:
+        raise RequestError('Malformed request : %s'%error)
+
+    return method, path, body
+
+
+async def handle_http(service, reader, writer):
+    # Minimal HTTP/1.1 : POST /compute with {"millesime", "alias_values", "formula_names"}, GET /metrics
+
+    try:
+        try:
+            method, path, body = await read_http_request(reader)
+
+            if (method, path) == ('GET', '/metrics'):
+                status, response = '200 OK', service.metrics()
+            elif (method, path) == ('POST', '/compute'):
+                try:
+                    request = json.loads(body.decode('utf-8'))
+                    millesime, alias_values, formula_names = request['millesime'], request['alias_values'], request['formula_names']
+                except (ValueError, KeyError, TypeError) as error:
+                    raise RequestError('Malformed request : %r'%error)
+                result = await service.compute(millesime, alias_values, formula_names)
+                status, response = '200 OK', result
+            else:
+                status, response = '404 Not Found', {'error': 'Unknown route.'}
+        except RequestError as error:
+            status, response = '400 Bad Request', {'error': str(error)}
+        except (ServiceClosed, asyncio.CancelledError):
+            status, response = '503 Service Unavailable', {'error': 'Service closed.'}
+        except Exception as error:
+            status, response = '500 Internal Server Error', {'error': repr(error)}
+
+        payload = json.dumps(response).encode('utf-8')
+        writer.write((
+            'HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n'%(status, len(payload))
+        ).encode('latin-1') + payload)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP de calcul de l'impôt par micro-lots")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait', type=float, default=0.01)
+    parser.add_argument('--padding', choices=sorted(padding_strategies), default='power_of_two')
+    parser.add_argument('--max-queue-size', type=int, default=4096)
+    parser.add_argument('--millesimes', nargs='*', default=[], help='millésimes chargés au démarrage')
+    args = parser.parse_args()
+
+    service = MicroBatchingService(args.max_batch_size, args.max_wait, args.padding, args.max_queue_size)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for millesime in args.millesimes:
+        loop.run_until_complete(service.warm(millesime))
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: handle_http(service, reader, writer), args.host, args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+
+
+if __name__ == '__main__':
+    main()
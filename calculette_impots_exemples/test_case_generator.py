@@ -92,7 +92,45 @@ def gen(n):
 
     return cases
 
-def tirage(value):
+def gen_columns(n, seed=None):
+    # Same distributions as gen, drawn column-wise : returns {alias: array of n values}, 0 when absent
+
+    random_state = np.random.RandomState(seed)
+    rv = random_state.rand(n,12)
+
+    def draw(value):
+        return tirage(value, size=n, random_state=random_state)
+
+    columns = {}
+
+    columns['0AC'] = (rv[:,1] < 0.4)
+    columns['0AM'] = (rv[:,1] >= 0.4) & (rv[:,1] < 0.72)
+    columns['0AD'] = (rv[:,1] >= 0.72) & (rv[:,1] < 0.87)
+    columns['0AV'] = (rv[:,1] >= 0.87) & (rv[:,1] < 0.95)
+    columns['0AO'] = (rv[:,1] >= 0.95)
+
+    columns['0CF'] = (rv[:,2] < 0.27) * np.round(draw(1.8))
+    columns['0DJ'] = (rv[:,3] < 0.05) * np.round(draw(1))
+
+    columns['1AJ'] = (rv[:,4] < 0.57) * draw(24000)
+    columns['1AP'] = (rv[:,4] >= 0.57) * (rv[:,4] < 0.62) * draw(6186)
+    columns['1AS'] = (rv[:,4] >= 0.62) * (rv[:,4] < 0.93) * draw(19682)
+
+    couple = columns['0AM'] | columns['0AO']
+    columns['1BJ'] = couple * (rv[:,5] < 0.57) * draw(20300)
+    columns['1BP'] = couple * (rv[:,5] >= 0.57) * (rv[:,5] < 0.62) * draw(6100)
+    columns['1BS'] = couple * (rv[:,5] >= 0.62) * (rv[:,5] < 0.93) * draw(12188)
+
+    columns['2DC'] = (rv[:,6] < 0.27) * draw(1400)
+    columns['2TR'] = (rv[:,7] < 0.3) * draw(652)
+    columns['2CK'] = (rv[:,8] < 0.3) * draw(324)
+    columns['4BA'] = (rv[:,9] < 0.07) * draw(12500)
+    columns['6DE'] = (rv[:,10] < 0.11) * draw(717)
+    columns['7UF'] = (rv[:,11] < 0.13) * draw(450)
+
+    return {alias: values.astype(float) for alias, values in columns.items()}
+
+def tirage(value, size=None, random_state=None):
     ### Several statistics dirtributions possible
     # Fonction random entre 0 et 2*value
     # return np.random.randint(0, 2*value)
@@ -100,4 +138,4 @@ def tirage(value):
     # return np.absolute(np.random.normal(value, value/2))
 
     # Fonction random suivant une loi de Fisk
-    return np.round(scipy.stats.fisk.rvs(4, loc=0, scale=value))
+    return np.round(scipy.stats.fisk.rvs(4, loc=0, scale=value, size=size, random_state=random_state))